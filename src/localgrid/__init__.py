@@ -4,7 +4,10 @@ LocalGrid: A library to inspect and get metadata for local LLMs.
 from .core import (
     usage,
     count,
+    count_batch,
     limit,
+    estimate,
+    fits,
     preload,
 )
 
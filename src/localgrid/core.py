@@ -1,9 +1,16 @@
 import os
 import re
+import sys
 import json
 from importlib import resources
-import tiktoken
 import asyncio
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson  # optional, parses the model DB several times faster than json
+except ImportError:
+    orjson = None
 
 from .mappings import TOKENIZER_CONSOLIDATION_MAP
 
@@ -11,68 +18,122 @@ os.environ["TRANSFORMERS_VERBOSITY"] = "error"
 os.environ["TRANSFORMERS_NO_ADVISORY_WARNINGS"] = "1"
 
 _models = None  # treat these as states
+_limits = None  # model name -> parsed token limit
 _tokenizer_cache = {}
+_model_tokenizer_cache = {}  # full model name -> resolved tokenizer
+_count_cache = OrderedDict()  # (model, len, hash) -> token count, LRU ordered
+_count_lock = threading.Lock()  # guards the LRU reorder/evict steps across threads
+_NOT_LOADED = object()
+_default_tokenizer = _NOT_LOADED  # None once loading has failed
+_db_lock = threading.RLock()  # preload and callers may hit a cold start from different threads
+_tokenizer_locks = {}  # tokenizer dir name -> lock, so each family is only loaded once
 
 DEFAULT_TOKEN_LIMIT = 8192
 FALLBACK_TOKEN_RATIO = 4
+COUNT_CACHE_SIZE = 4096
+COUNT_CACHE_MAX_TEXT = 1 << 16  # longer texts are counted but never cached
+
+TOKENIZERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizers")
 
 # all unique 25 base tokenizers 
 BASE_TOKENIZERS = sorted(set(TOKENIZER_CONSOLIDATION_MAP.values()))
 
-try:
-    _default_tokenizer = tiktoken.get_encoding("cl100k_base")
-except Exception:
-    _default_tokenizer = None
+# family keys longest first so "nous-hermes2-mixtral" beats "nous-hermes2" and "mixtral",
+# equal lengths keep mapping order (sorted is stable) so the result never depends on hashing
+FAMILIES_LONGEST_FIRST = tuple(sorted(TOKENIZER_CONSOLIDATION_MAP, key=len, reverse=True))
+
+# most names start with their family ("llama3.1:8b"), so bucket keys by first letter
+# and try the few prefix candidates before scanning the whole name
+_FAMILIES_BY_INITIAL = {}
+for _family in FAMILIES_LONGEST_FIRST:
+    _FAMILIES_BY_INITIAL.setdefault(_family[0], []).append(_family)
+del _family
+
+
+def _get_default_tokenizer():
+    """Builds the tiktoken fallback encoding on first use."""
+    global _default_tokenizer
+    if _default_tokenizer is _NOT_LOADED:  # cold start
+        try:
+            import tiktoken
+            _default_tokenizer = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _default_tokenizer = None
+    return _default_tokenizer
+
+
+def _read_data_file(file_name: str) -> bytes:
+    """Reads a bundled data file in place, without extracting zipped installs to a temp file."""
+    if hasattr(resources, 'files'):
+        return resources.files('localgrid.data').joinpath(file_name).read_bytes()
+    return resources.read_binary('localgrid.data', file_name)  # Python 3.8
 
 
 def _load_cache() -> dict:
     """Loads the pre-processed unified database from the cache file."""
     global _models
     if _models is None:  # cold start
-        try:
-            with resources.path('localgrid.data', 'localgrid_cache.json') as cache_path:
-                with open(cache_path, 'r', encoding='utf-8') as f:
-                    _models = json.load(f)
-        except FileNotFoundError:
-            print("Error: Cache file 'localgrid_cache.json' not found.")
-            _models = {}
-        except Exception as err:
-            print(f"Error loading cache: {err}")
-            _models = {}
+        with _db_lock:
+            if _models is None:
+                try:
+                    raw = _read_data_file('localgrid_cache.json')
+                    parsed = orjson.loads(raw) if orjson else json.loads(raw)
+                    _models = {_canonical_name(name): data for name, data in parsed.items()}
+                except FileNotFoundError:
+                    print("Error: Cache file 'localgrid_cache.json' not found.")
+                    _models = {}
+                except Exception as err:
+                    print(f"Error loading cache: {err}")
+                    _models = {}
     return _models
 
 
+def _canonical_name(model_name: str) -> str:
+    """Model names are case-insensitive; lowercase and intern them so lookups can hit by identity."""
+    return sys.intern(model_name.lower())
+
+
 def _load_tokenizer_from_disk(tokenizer_dir_name: str):
-    """Synchronous helper to load a tokenizer."""
-    if tokenizer_dir_name in _tokenizer_cache:
-        return _tokenizer_cache[tokenizer_dir_name]
-    
-    try:  # cold start
-        from transformers import AutoTokenizer
-        base_path = os.path.dirname(os.path.abspath(__file__))
-        tokenizer_dir_path = os.path.join(base_path, "tokenizers", tokenizer_dir_name)
-        
-        if os.path.isdir(tokenizer_dir_path):
-            tokenizer = AutoTokenizer.from_pretrained(tokenizer_dir_path, trust_remote_code=True)
-            _tokenizer_cache[tokenizer_dir_name] = tokenizer
-            return tokenizer
-    except Exception as err:
-        print(f"Warning: Could not load bundled tokenizer for {tokenizer_dir_name}: {err}")
+    """Synchronous helper to load a tokenizer, remembering failures as None."""
+    tokenizer = _tokenizer_cache.get(tokenizer_dir_name, _NOT_LOADED)
+    if tokenizer is not _NOT_LOADED:
+        return tokenizer
     
-    return None
+    with _tokenizer_locks.setdefault(tokenizer_dir_name, threading.Lock()):
+        tokenizer = _tokenizer_cache.get(tokenizer_dir_name, _NOT_LOADED)
+        if tokenizer is not _NOT_LOADED:  # another thread finished loading it
+            return tokenizer
+        
+        try:  # cold start
+            from transformers import AutoTokenizer
+            tokenizer_dir_path = os.path.join(TOKENIZERS_DIR, tokenizer_dir_name)
+            
+            if os.path.isdir(tokenizer_dir_path):
+                tokenizer = AutoTokenizer.from_pretrained(
+                    tokenizer_dir_path,
+                    use_fast=True,
+                    local_files_only=True,  # bundled files only, never reach for the Hub
+                    trust_remote_code=True,
+                )
+                _tokenizer_cache[tokenizer_dir_name] = tokenizer
+                return tokenizer
+        except Exception as err:
+            print(f"Warning: Could not load bundled tokenizer for {tokenizer_dir_name}: {err}")
+        
+        _tokenizer_cache[tokenizer_dir_name] = None
+        return None
 
 
 async def preload(families: list = None):
-    """Asynchronously pre-loads tokenizers into the cache."""
-    _load_cache()
-    
+    """Asynchronously pre-loads the model DB and tokenizers into the cache, in parallel."""
     if families is None:
         families = BASE_TOKENIZERS
     else:
         families = list(set(TOKENIZER_CONSOLIDATION_MAP.get(family, family) for family in families))
     
     loop = asyncio.get_running_loop()
-    tasks = [
+    tasks = [loop.run_in_executor(None, _load_limits)]  # parses the DB off the event loop
+    tasks += [
         loop.run_in_executor(None, _load_tokenizer_from_disk, family)
         for family in families
     ]
@@ -80,7 +141,30 @@ async def preload(families: list = None):
 
 
 def _get_tokenizer(model_name: str):
-    """Finds the appropriate tokenizer, loading it synchronously if not in cache."""
+    """Finds the tokenizer for a canonical model name, loading it synchronously if not in cache."""
+    tokenizer = _model_tokenizer_cache.get(model_name)
+    if tokenizer is not None:
+        return tokenizer
+    
+    tokenizer = _resolve_tokenizer(model_name)
+    _model_tokenizer_cache[model_name] = tokenizer
+    return tokenizer
+
+
+def _match_family(name: str):
+    """Finds the family key in a free-form name, preferring a prefix hit over a substring one."""
+    for family in _FAMILIES_BY_INITIAL.get(name[:1], ()):
+        if name.startswith(family):
+            return family
+    
+    for family in FAMILIES_LONGEST_FIRST:
+        if family in name:
+            return family
+    return None
+
+
+def _resolve_tokenizer(model_name: str):
+    """Maps a model name to its tokenizer by DB family, then by substring match."""
     models = _load_cache()
     model_data = models.get(model_name)
     
@@ -92,26 +176,46 @@ def _get_tokenizer(model_name: str):
     base_tokenizer = TOKENIZER_CONSOLIDATION_MAP.get(family_to_match)
     
     if base_tokenizer:
-        return _load_tokenizer_from_disk(base_tokenizer) or _default_tokenizer
+        return _load_tokenizer_from_disk(base_tokenizer) or _get_default_tokenizer()
     
    #fallback logic trying to be dummy proof
-    sorted_families = sorted(TOKENIZER_CONSOLIDATION_MAP.keys(), key=len, reverse=True)
+    family_key = _match_family(family_to_match)
     
-    for family_key in sorted_families:
-        if family_key in family_to_match:
-            base_tokenizer = TOKENIZER_CONSOLIDATION_MAP[family_key]
-            return _load_tokenizer_from_disk(base_tokenizer) or _default_tokenizer
+    if family_key:
+        base_tokenizer = TOKENIZER_CONSOLIDATION_MAP[family_key]
+        return _load_tokenizer_from_disk(base_tokenizer) or _get_default_tokenizer()
     
-    return _default_tokenizer
+    return _get_default_tokenizer()
 
 
 def count(text: str, model: str) -> int:
-    """Provides an accurate token count for a given model and text."""
+    """Provides an accurate token count for a given model and text. Model names are case-insensitive."""
+    model = _canonical_name(model)
+    if len(text) > COUNT_CACHE_MAX_TEXT:
+        return _count_uncached(text, model)
+    
+    key = (model, len(text), hash(text))
+    with _count_lock:
+        cached = _count_cache.get(key)
+        if cached is not None:
+            _count_cache.move_to_end(key)
+            return cached
+    
+    result = _count_uncached(text, model)  # tokenize outside the lock
+    with _count_lock:
+        _count_cache[key] = result
+        if len(_count_cache) > COUNT_CACHE_SIZE:
+            _count_cache.popitem(last=False)
+    return result
+
+
+def _count_uncached(text: str, model: str) -> int:
+    """Runs the model's tokenizer over the text without consulting the count cache."""
     tokenizer = _get_tokenizer(model)
     
     if tokenizer:
-        if isinstance(tokenizer, tiktoken.Encoding):
-            return len(tokenizer.encode(text, disallowed_special=()))
+        if type(tokenizer).__module__.startswith('tiktoken'):
+            return len(tokenizer.encode_ordinary(text))
         elif hasattr(tokenizer, 'encode'):
             return len(tokenizer.encode(text, add_special_tokens=False))
     
@@ -119,53 +223,118 @@ def count(text: str, model: str) -> int:
     return len(text) // FALLBACK_TOKEN_RATIO
 
 
-def limit(model: str) -> int:
-    """Gets the context size (token limit) for a given model."""
-    models = _load_cache()
-    model_data = models.get(model)
+def count_batch(texts: list, model: str) -> list:
+    """Counts tokens for many texts at once, encoding them in a single tokenizer call."""
+    texts = list(texts)
+    if not texts:  # HF fast tokenizers reject an empty batch
+        return []
     
-    if model_data:
-        context_val = model_data.get('context')
-        
-        try:
-            if isinstance(context_val, (int, float)):
-                return int(context_val * 1024) if context_val < 1024 else int(context_val)
-
-            if isinstance(context_val, str):
-                val_str = context_val.upper().strip()
-                
-                if not val_str or val_str == "N/A":
-                    return DEFAULT_TOKEN_LIMIT
-
-                multiplier = 1
-                if 'M' in val_str:
-                    multiplier = 1024 * 1024
-                    val_str = val_str.replace('M', '')
-                elif 'K' in val_str:
-                    multiplier = 1024
-                    val_str = val_str.replace('K', '')
-                
-                # Clean out any non-numeric characters
-                numeric_part = re.sub(r"[^0-9.]", "", val_str)
-                
-                if not numeric_part:
-                    return DEFAULT_TOKEN_LIMIT
-
-                number = float(numeric_part)
-                result = int(number * multiplier)
-                
-                # Threshold rule for strings that had no 'K' or 'M'
-                if multiplier == 1 and result < 1024:
-                    return result * 1024
-                
-                return result
-
-        except (ValueError, TypeError, AttributeError):
-            pass 
+    tokenizer = _get_tokenizer(_canonical_name(model))
+    
+    if tokenizer:
+        if type(tokenizer).__module__.startswith('tiktoken'):
+            encoded = tokenizer.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1)
+            return [len(ids) for ids in encoded]
+        elif hasattr(tokenizer, 'encode'):
+            encoded = tokenizer(
+                texts,
+                add_special_tokens=False,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+            )
+            return [len(ids) for ids in encoded['input_ids']]
+    
+    # Fallback to character-based estimation
+    return [len(text) // FALLBACK_TOKEN_RATIO for text in texts]
+
+
+def _parse_context(context_val) -> int:
+    """Turns a raw DB context value ("128K", "2M", 8192, "N/A") into a token count."""
+    try:
+        if isinstance(context_val, (int, float)):
+            return int(context_val * 1024) if context_val < 1024 else int(context_val)
+
+        if isinstance(context_val, str):
+            # fast path for the common "128K" / "8192" forms, no intermediate strings.
+            # ASCII only, so it agrees with the [0-9] strip in the general parser
+            if context_val.isascii():
+                if context_val[-1:] in ('K', 'k') and context_val[:-1].isdigit():
+                    return int(context_val[:-1]) * 1024
+                if context_val.isdigit():
+                    number = int(context_val)
+                    return number * 1024 if number < 1024 else number
+
+            val_str = context_val.upper().strip()
+            
+            if not val_str or val_str == "N/A":
+                return DEFAULT_TOKEN_LIMIT
+
+            multiplier = 1
+            if 'M' in val_str:
+                multiplier = 1024 * 1024
+                val_str = val_str.replace('M', '')
+            elif 'K' in val_str:
+                multiplier = 1024
+                val_str = val_str.replace('K', '')
+            
+            # Clean out any non-numeric characters
+            numeric_part = re.sub(r"[^0-9.]", "", val_str)
+            
+            if not numeric_part:
+                return DEFAULT_TOKEN_LIMIT
+
+            number = float(numeric_part)
+            result = int(number * multiplier)
+            
+            # Threshold rule for strings that had no 'K' or 'M'
+            if multiplier == 1 and result < 1024:
+                return result * 1024
+            
+            return result
+
+    except (ValueError, TypeError, AttributeError):
+        pass 
     
     return DEFAULT_TOKEN_LIMIT
 
 
+def _load_limits() -> dict:
+    """Resolves every model's token limit once, so limit() is a single dict lookup."""
+    global _limits
+    if _limits is None:  # cold start
+        with _db_lock:
+            if _limits is None:
+                _limits = {
+                    model_name: _parse_context(model_data.get('context'))
+                    for model_name, model_data in _load_cache().items()
+                }
+    return _limits
+
+
+def limit(model: str) -> int:
+    """Gets the context size (token limit) for a given model. Model names are case-insensitive."""
+    return _load_limits().get(_canonical_name(model), DEFAULT_TOKEN_LIMIT)
+
+
+def estimate(text: str) -> int:
+    """Rough token count from the text length alone, never loads a tokenizer."""
+    return len(text) // FALLBACK_TOKEN_RATIO
+
+
+def fits(text: str, model: str) -> bool:
+    """Checks whether text fits in the model's context, tokenizing only when it is not obviously short."""
+    model_limit = limit(model)
+    
+    # accept on characters, not the /4 estimate: CJK and symbol-heavy text can run
+    # close to one token per character, so only half the limit in characters is safe.
+    # there is no matching fast reject, whitespace or repeated symbols can compress
+    # far below the estimate, so anything longer gets an exact count
+    if len(text) < model_limit // 2:
+        return True
+    
+    return count(text, model) <= model_limit
+
+
 def usage(text: str, model: str) -> str:
     """Returns a string showing used tokens vs. the model's total limit."""
     model_limit = limit(model)
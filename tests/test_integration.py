@@ -1,19 +1,17 @@
 import pytest
 import json
-from importlib import resources
 
 import localgrid
 from localgrid.core import (
     BASE_TOKENIZERS, 
+    FAMILIES_LONGEST_FIRST,
     TOKENIZER_CONSOLIDATION_MAP
 )
 
 @pytest.fixture(scope="session")
 def real_model_cache():
     try:
-        with resources.path('localgrid.data', 'localgrid_cache.json') as cache_path:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+        return json.loads(localgrid.core._read_data_file('localgrid_cache.json'))
     except Exception:
         print("ERROR: localgrid_cache.json not found or failed to load")
         return {}
@@ -47,8 +45,7 @@ def test_all_models_in_cache_are_valid(real_model_cache):
         base_tokenizer = TOKENIZER_CONSOLIDATION_MAP.get(family_to_match)
         
         if not base_tokenizer:
-            sorted_keys = sorted(TOKENIZER_CONSOLIDATION_MAP.keys(), key=len, reverse=True)
-            for key in sorted_keys:
+            for key in FAMILIES_LONGEST_FIRST:
                 if key in family_to_match:
                     base_tokenizer = TOKENIZER_CONSOLIDATION_MAP[key]
                     break
@@ -68,5 +65,6 @@ async def test_async_preload_all_tokenizers():
     await localgrid.preload()
     
     assert len(localgrid.core._tokenizer_cache) == len(BASE_TOKENIZERS)
+    assert all(tokenizer is not None for tokenizer in localgrid.core._tokenizer_cache.values())
     
     localgrid.core._tokenizer_cache = {}
\ No newline at end of file
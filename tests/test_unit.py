@@ -1,12 +1,14 @@
 import os
+import threading
 import pytest
 import tiktoken
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock
 
 import localgrid
-from localgrid import limit, count, preload
+from localgrid import limit, count, count_batch, estimate, fits, preload
 from localgrid.core import (
-    _default_tokenizer,
     FALLBACK_TOKEN_RATIO,
     BASE_TOKENIZERS,
     DEFAULT_TOKEN_LIMIT
@@ -27,6 +29,10 @@ MOCK_MODELS_DB = {
     "model-large-str": {"context": "8192"},
     "model-megatokens": {"context": "2M"},
     "model-float-k": {"context": "8.5K"},
+    "model-lower-k": {"context": "4k"},
+    "model-padded-k": {"context": " 16K "},
+    "model-arabic-digits": {"context": "١٢٨K"},
+    "model-superscript": {"context": "²"},
     "model-bad-string": {"context": "Unknown"}
 }
 
@@ -34,10 +40,11 @@ MOCK_MODELS_DB = {
 @pytest.fixture(autouse=True)
 def setup_mock_db_and_clear_cache_before_each_test(mocker):
     mocker.patch('localgrid.core._load_cache', return_value=MOCK_MODELS_DB)
+    mocker.patch('localgrid.core._limits', None)
     mocker.patch.dict('localgrid.core._tokenizer_cache', {}, clear=True)
-
-    if _default_tokenizer is None:
-        mocker.patch('localgrid.core._default_tokenizer', tiktoken.get_encoding("cl100k_base"))
+    mocker.patch.dict('localgrid.core._model_tokenizer_cache', {}, clear=True)
+    mocker.patch.dict('localgrid.core._count_cache', {}, clear=True)
+    mocker.patch('localgrid.core._default_tokenizer', tiktoken.get_encoding("cl100k_base"))
 
 
 @pytest.fixture
@@ -78,11 +85,66 @@ def mock_hf_tokenizer_loader(mocker):
     ("model-large-str", 8192),
     ("model-megatokens", 2097152),
     ("model-float-k", 8704),
+    ("model-lower-k", 4096),
+    ("model-padded-k", 16384),
+    ("model-arabic-digits", DEFAULT_TOKEN_LIMIT),
+    ("model-superscript", DEFAULT_TOKEN_LIMIT),
+    ("Phi:Latest", 2048),
+    ("GOOGLE/GEMMA-3N-E4B", 32768),
 ])
 def test_limit_function_parses_context_values_correctly(model_name, expected_limit):
     assert limit(model=model_name) == expected_limit
 
 
+def test_limits_are_parsed_once_for_the_whole_db(mocker):
+    parse_spy = mocker.spy(localgrid.core, '_parse_context')
+
+    limit(model="phi:latest")
+    limit(model="openthinker:7b")
+
+    assert parse_spy.call_count == len(MOCK_MODELS_DB)
+
+
+def test_estimate_uses_character_ratio():
+    text = "This is a fallback test."
+    assert estimate(text) == len(text) // FALLBACK_TOKEN_RATIO
+
+
+def test_fits_skips_tokenizer_for_short_text(mocker):
+    count_spy = mocker.spy(localgrid.core, 'count')
+
+    assert fits("x" * 100, model="phi:latest") is True
+    count_spy.assert_not_called()
+
+
+def test_fits_counts_exactly_for_long_but_compressible_text(mocker):
+    count_mock = mocker.patch('localgrid.core.count', return_value=1025)
+    text = "=" * (2048 * FALLBACK_TOKEN_RATIO * 3)  # estimate 6x the limit, real count well under it
+
+    assert fits(text, model="phi:latest") is True
+    count_mock.assert_called_once_with(text, "phi:latest")
+
+
+def test_fits_counts_exactly_for_dense_non_ascii_text(mocker):
+    count_mock = mocker.patch('localgrid.core.count', return_value=3553)
+    text = "漢字のテキスト" * 430  # ~3000 chars, estimate 752 tokens, far under the 2048 limit
+
+    assert fits(text, model="phi:latest") is False
+    count_mock.assert_called_once_with(text, "phi:latest")
+
+
+@pytest.mark.parametrize("exact_count, expected_fit", [
+    (2048, True),
+    (2049, False),
+])
+def test_fits_counts_exactly_when_estimate_is_borderline(mocker, exact_count, expected_fit):
+    count_mock = mocker.patch('localgrid.core.count', return_value=exact_count)
+    text = "x" * (2048 * FALLBACK_TOKEN_RATIO)
+
+    assert fits(text, model="phi:latest") is expected_fit
+    count_mock.assert_called_once_with(text, "phi:latest")
+
+
 @pytest.mark.parametrize("model_name, text, expected_count, expected_tokenizer_family", [
     ("granite3.1-moe:latest", "Hello world this is gemma", 5, "gemma"),
     ("mistral-small3.2:latest", "Hello world this is mistral", 5, "mistral"),
@@ -102,20 +164,48 @@ def test_count_uses_correct_hf_tokenizer_when_available(
 
     tokenizer_path_arg = mock_hf_tokenizer_loader.call_args[0][0]
     assert tokenizer_path_arg.endswith(expected_tokenizer_family)
+    assert mock_hf_tokenizer_loader.call_args[1]['use_fast'] is True
+    assert mock_hf_tokenizer_loader.call_args[1]['local_files_only'] is True
 
     fake_tokenizer = mock_hf_tokenizer_loader.return_value
     fake_tokenizer.encode.assert_called_once_with(text, add_special_tokens=False)
 
 
+@pytest.mark.parametrize("model_name, expected_tokenizer_family", [
+    ("my-custom-llama3-chatqa:8b", "llama"),
+    ("hf.co/someone/Qwen-finetune-qwen2.5-coder:q4", "qwen"),
+    ("phi-llama3-gradient:latest", "phi"),
+    ("llava:7b-v1.6-mistral-custom", "llama"),
+    ("nous-hermes2-mixtral-finetune:latest", "mistral"),
+    ("dolphin-mixtral-custom:8x7b", "mistral"),
+])
+def test_count_matches_family_for_unknown_models(
+    mock_hf_tokenizer_loader,
+    model_name,
+    expected_tokenizer_family
+):
+    count(text="hello", model=model_name)
+
+    tokenizer_path_arg = mock_hf_tokenizer_loader.call_args[0][0]
+    assert tokenizer_path_arg.endswith(expected_tokenizer_family)
+
+
+def test_families_are_ordered_longest_first():
+    lengths = [len(family) for family in localgrid.core.FAMILIES_LONGEST_FIRST]
+
+    assert isinstance(localgrid.core.FAMILIES_LONGEST_FIRST, tuple)
+    assert lengths == sorted(lengths, reverse=True)
+
+
 def test_count_falls_back_to_tiktoken_if_hf_fails(mocker):
     mocker.patch('os.path.isdir', return_value=False)
 
-    tiktoken_encode_spy = mocker.spy(localgrid.core._default_tokenizer, 'encode')
+    tiktoken_encode_spy = mocker.spy(localgrid.core._default_tokenizer, 'encode_ordinary')
 
     token_count = count(text="hello world", model="llama4:latest")
 
     assert token_count == 2
-    tiktoken_encode_spy.assert_called_once_with("hello world", disallowed_special=())
+    tiktoken_encode_spy.assert_called_once_with("hello world")
 
 
 def test_count_falls_back_to_ratio_if_all_tokenizers_fail(mocker):
@@ -129,6 +219,42 @@ def test_count_falls_back_to_ratio_if_all_tokenizers_fail(mocker):
     assert token_count == expected_count
 
 
+def test_count_batch_encodes_all_texts_in_one_hf_call(mock_hf_tokenizer_loader):
+    fake_tokenizer = mock_hf_tokenizer_loader.return_value
+    fake_tokenizer.return_value = {'input_ids': [[1, 2], [1, 2, 3]]}
+
+    counts = count_batch(["hello", "hello world"], model="granite3.1-moe:latest")
+
+    assert counts == [2, 3]
+    fake_tokenizer.assert_called_once_with(
+        ["hello", "hello world"],
+        add_special_tokens=False,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+    )
+    fake_tokenizer.encode.assert_not_called()
+
+
+def test_count_batch_matches_count_with_tiktoken(mocker):
+    mocker.patch('os.path.isdir', return_value=False)
+    texts = ["hello world", "", "a somewhat longer sentence to encode"]
+
+    assert count_batch(texts, model="llama4:latest") == [count(text, model="llama4:latest") for text in texts]
+
+
+def test_count_batch_returns_empty_list_for_no_texts(mock_hf_tokenizer_loader):
+    assert count_batch([], model="granite3.1-moe:latest") == []
+    mock_hf_tokenizer_loader.return_value.assert_not_called()
+
+
+def test_count_batch_falls_back_to_ratio(mocker):
+    mocker.patch('os.path.isdir', return_value=False)
+    mocker.patch('localgrid.core._default_tokenizer', None)
+
+    texts = ["This is a fallback test.", "short"]
+    assert count_batch(texts, model="llama4:latest") == [len(text) // FALLBACK_TOKEN_RATIO for text in texts]
+
+
 def test_tokenizer_is_cached_after_first_load(mock_hf_tokenizer_loader):
     count("text 1", model="google/gemma-3n-e4b")
     count("text 2", model="granite3.1-moe:latest")
@@ -136,6 +262,66 @@ def test_tokenizer_is_cached_after_first_load(mock_hf_tokenizer_loader):
     mock_hf_tokenizer_loader.assert_called_once()
 
 
+def test_failed_tokenizer_load_is_not_retried(mocker):
+    isdir_mock = mocker.patch('os.path.isdir', return_value=False)
+
+    count("text 1", model="google/gemma-3n-e4b")
+    count("text 2", model="granite3.1-moe:latest")
+
+    isdir_mock.assert_called_once()
+
+
+def test_model_name_resolution_is_cached(mock_hf_tokenizer_loader, mocker):
+    resolve_spy = mocker.spy(localgrid.core, '_resolve_tokenizer')
+
+    count("text 1", model="granite3.1-moe:latest")
+    count("text 2", model="granite3.1-moe:latest")
+
+    resolve_spy.assert_called_once_with("granite3.1-moe:latest")
+
+
+def test_repeated_count_skips_tokenizer(mock_hf_tokenizer_loader):
+    fake_tokenizer = mock_hf_tokenizer_loader.return_value
+
+    assert count("same text", model="granite3.1-moe:latest") == 5
+    assert count("same text", model="granite3.1-moe:latest") == 5
+
+    fake_tokenizer.encode.assert_called_once_with("same text", add_special_tokens=False)
+
+
+def test_count_treats_model_names_case_insensitively(mock_hf_tokenizer_loader):
+    fake_tokenizer = mock_hf_tokenizer_loader.return_value
+
+    count("same text", model="Granite3.1-MoE:latest")
+    count("same text", model="granite3.1-moe:LATEST")
+
+    fake_tokenizer.encode.assert_called_once_with("same text", add_special_tokens=False)
+    assert mock_hf_tokenizer_loader.call_args[0][0].endswith("gemma")
+
+
+def test_count_cache_evicts_least_recently_used(mocker):
+    mocker.patch('localgrid.core.COUNT_CACHE_SIZE', 2)
+    mocker.patch('localgrid.core._get_tokenizer', return_value=None)
+
+    count("a", model="m")
+    count("b", model="m")
+    count("a", model="m")
+    count("c", model="m")
+
+    cached_texts = {key[1:] for key in localgrid.core._count_cache}
+    assert cached_texts == {(1, hash("a")), (1, hash("c"))}
+
+
+def test_default_tokenizer_is_loaded_lazily(mocker):
+    mocker.patch('localgrid.core._default_tokenizer', localgrid.core._NOT_LOADED)
+    get_encoding_spy = mocker.spy(tiktoken, 'get_encoding')
+
+    localgrid.core._get_default_tokenizer()
+    localgrid.core._get_default_tokenizer()
+
+    get_encoding_spy.assert_called_once_with("cl100k_base")
+
+
 @pytest.mark.asyncio
 async def test_preload_loads_specified_families(mocker):
     disk_load_spy = mocker.spy(localgrid.core, '_load_tokenizer_from_disk')
@@ -151,6 +337,51 @@ async def test_preload_loads_specified_families(mocker):
     assert loaded_families == set(families_to_load)
 
 
+@pytest.mark.asyncio
+async def test_preload_warms_token_limits(mocker):
+    mocker.patch('transformers.AutoTokenizer.from_pretrained', return_value=MagicMock())
+    mocker.patch('os.path.isdir', return_value=True)
+
+    await preload(families=['phi'])
+
+    assert localgrid.core._limits["phi:latest"] == 2048
+
+
+def test_concurrent_loads_of_one_family_load_it_once(mocker):
+    mocker.patch('os.path.isdir', return_value=True)
+    loader = mocker.patch('transformers.AutoTokenizer.from_pretrained', return_value=MagicMock())
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(localgrid.core._load_tokenizer_from_disk, ['llama'] * 32))
+
+    loader.assert_called_once()
+
+
+def test_count_survives_eviction_by_another_thread(mocker):
+    class CacheEvictedMidLookup(OrderedDict):
+        """Lets another thread count (and evict) right after a cache hit is read."""
+        other_thread = None
+
+        def get(self, key, default=None):
+            value = super().get(key, default)
+            if value is not None and self.other_thread is None:
+                self.other_thread = threading.Thread(target=count, args=("evicts a", "m"))
+                self.other_thread.start()
+                self.other_thread.join(timeout=0.2)
+            return value
+
+    cache = CacheEvictedMidLookup()
+    mocker.patch('localgrid.core._count_cache', cache)
+    mocker.patch('localgrid.core.COUNT_CACHE_SIZE', 1)
+    mocker.patch('localgrid.core._get_tokenizer', return_value=None)
+
+    count("aaaa", model="m")
+    assert count("aaaa", model="m") == 1
+
+    cache.other_thread.join()
+    assert len(cache) == 1
+
+
 @pytest.mark.asyncio
 async def test_preload_loads_all_families_by_default(mocker):
     disk_load_spy = mocker.spy(localgrid.core, '_load_tokenizer_from_disk')